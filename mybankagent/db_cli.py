@@ -19,6 +19,7 @@ Commands:
 import os
 import sys
 import argparse
+from datetime import datetime
 from mybankagent.src.mybankagent.tools.db_manager import BankingDBManager
 
 def main():
@@ -84,16 +85,15 @@ def main():
             print(f"Error: {info.get('error', 'Unknown error')}")
         
         # Show knowledge directory info
-        text_files = [f for f in os.listdir(args.knowledge_dir) if f.endswith('.txt')]
+        with os.scandir(args.knowledge_dir) as entries:
+            text_files = [entry for entry in entries if entry.name.endswith('.txt')]
         print(f"\nKnowledge directory: {args.knowledge_dir}")
         print(f"Text files: {len(text_files)}")
-        for file in text_files:
-            path = os.path.join(args.knowledge_dir, file)
-            size = os.path.getsize(path) / 1024  # KB
-            modified = os.path.getmtime(path)
-            from datetime import datetime
-            modified_str = datetime.fromtimestamp(modified).strftime('%Y-%m-%d %H:%M:%S')
-            print(f" - {file} ({size:.1f} KB, modified: {modified_str})")
+        for entry in text_files:
+            stat = entry.stat()
+            size = stat.st_size / 1024  # KB
+            modified_str = datetime.fromtimestamp(stat.st_mtime).strftime('%Y-%m-%d %H:%M:%S')
+            print(f" - {entry.name} ({size:.1f} KB, modified: {modified_str})")
     
     elif args.command == "rebuild":
         # Rebuild the database
@@ -5,7 +5,7 @@ from typing import List, Dict, Any
 import os
 
 # Import the RAG Tool
-from tools.rag_tool import RAGTool
+from tools.rag_tool import RAGTool, BatchKnowledgeBaseQueryTool
 
 @CrewBase
 class BankAgent():
@@ -24,41 +24,39 @@ class BankAgent():
             model='ollama/llama3.2:3b',
             base_url='http://127.0.0.1:11434'
         )
+        
+        # Shared RAG tool so the knowledge base is loaded once for all agents
+        self._rag_tool = RAGTool(knowledge_dir=self.knowledge_dir)
+        self._batch_rag_tool = BatchKnowledgeBaseQueryTool(rag_tool=self._rag_tool)
+        
+        # Advisor for answer_question, built on first use
+        self._financial_advisor_agent = None
     
     @agent
     def financial_advisor(self) -> Agent:
-        # Create the RAG tool
-        rag_tool = RAGTool(knowledge_dir=self.knowledge_dir)
-        
         return Agent(
             config=self.agents_config['financial_advisor'],  # type: ignore[index]
             verbose=True,
             llm=self.ollama_llm,
-            tools=[rag_tool]  # Add the RAG tool to the financial advisor agent
+            tools=[self._rag_tool, self._batch_rag_tool]  # Add the RAG tools to the financial advisor agent
         )
 
     @agent
     def customer_service(self) -> Agent:
-        # Create the RAG tool
-        rag_tool = RAGTool(knowledge_dir=self.knowledge_dir)
-        
         return Agent(
             config=self.agents_config['customer_service'],  # type: ignore[index]
             verbose=True,
             llm=self.ollama_llm,
-            tools=[rag_tool]  # Add the RAG tool to the customer service agent
+            tools=[self._rag_tool, self._batch_rag_tool]  # Add the RAG tools to the customer service agent
         )
         
     @agent
     def banking_analyst(self) -> Agent:
-        # Create the RAG tool
-        rag_tool = RAGTool(knowledge_dir=self.knowledge_dir)
-        
         return Agent(
             config=self.agents_config['banking_analyst'],  # type: ignore[index]
             verbose=True,
             llm=self.ollama_llm,
-            tools=[rag_tool]  # Add the RAG tool to the banking analyst agent
+            tools=[self._rag_tool, self._batch_rag_tool]  # Add the RAG tools to the banking analyst agent
         )
 
     @task
@@ -108,16 +106,21 @@ class BankAgent():
         Returns:
             The answer from the financial advisor agent
         """
+        # Build the advisor once and reuse it across questions
+        if self._financial_advisor_agent is None:
+            self._financial_advisor_agent = self.financial_advisor()
+        advisor = self._financial_advisor_agent
+        
         # Create a dynamic task for the question
         question_task = Task(
             description=f"Answer the following banking question using the Knowledge Base Query Tool:\n\n{question}",
             expected_output="A detailed and accurate answer based on the banking knowledge base",
-            agent=self.financial_advisor
+            agent=advisor
         )
         
         # Create a mini-crew with just this task
         mini_crew = Crew(
-            agents=[self.financial_advisor()],
+            agents=[advisor],
             tasks=[question_task],
             process=Process.sequential,
             verbose=True
@@ -37,12 +37,12 @@ def run_rag():
         print(f"Using knowledge directory: {args.knowledge_dir}")
         print("Type 'exit' to quit")
         
+        agent = BankAgent(knowledge_dir=args.knowledge_dir)
         while True:
             question = input("\nWhat would you like to know about banking services? ")
             if question.lower() in ['exit', 'quit', 'q']:
                 break
                 
-            agent = BankAgent(knowledge_dir=args.knowledge_dir)
             answer = agent.answer_question(question, args.topic)
             print("\nAnswer:")
             print(answer)
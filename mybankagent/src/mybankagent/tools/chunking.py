@@ -0,0 +1,46 @@
+"""
+Token-aware chunking shared by RAGTool and BankingDBManager, which both
+write the banking knowledge collection and must produce the same chunks.
+"""
+
+from functools import lru_cache
+from typing import Any, Dict, List, Tuple
+
+from langchain_core.documents import Document
+from semantic_text_splitter import TextSplitter
+from tokenizers import Tokenizer
+
+# Chunk sizes in model tokens; the model truncates input past 128 tokens when embedding
+CHUNK_TOKENS = 128
+CHUNK_OVERLAP_TOKENS = 16
+MIN_CHUNK_TOKENS = 32
+
+# Stored with indexes built from these chunks so a change of settings forces a full rebuild
+CHUNKING_VERSION = f"tokens-{CHUNK_TOKENS}-{CHUNK_OVERLAP_TOKENS}-{MIN_CHUNK_TOKENS}"
+
+@lru_cache(maxsize=None)
+def get_splitter(model_name: str) -> Tuple[TextSplitter, Tokenizer]:
+    """Build the model's tokenizer and a token-sized splitter over it, once per process."""
+    tokenizer = Tokenizer.from_pretrained(model_name)
+    splitter = TextSplitter.from_huggingface_tokenizer(
+        tokenizer, capacity=CHUNK_TOKENS, overlap=CHUNK_OVERLAP_TOKENS
+    )
+    return splitter, tokenizer
+
+def token_count(tokenizer: Tokenizer, text: str) -> int:
+    """Number of model tokens in text, excluding special tokens."""
+    return len(tokenizer.encode(text, add_special_tokens=False).ids)
+
+def split_document(content: str, metadata: Dict[str, Any], model_name: str) -> List[Document]:
+    """Split one document into token-sized chunks, folding short chunks into the previous one when they fit."""
+    splitter, tokenizer = get_splitter(model_name)
+    chunks = []
+    for start, text in splitter.chunk_indices(content):
+        if chunks and token_count(tokenizer, text) < MIN_CHUNK_TOKENS:
+            previous = chunks[-1]
+            combined = content[previous.metadata["start_index"]:start + len(text)]
+            if token_count(tokenizer, combined) <= CHUNK_TOKENS:
+                chunks[-1] = Document(page_content=combined, metadata=previous.metadata)
+                continue
+        chunks.append(Document(page_content=text, metadata={**metadata, "start_index": start}))
+    return chunks
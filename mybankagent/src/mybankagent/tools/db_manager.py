@@ -5,17 +5,45 @@ used by the Banking Agent RAG system.
 """
 
 import os
-import glob
+import hashlib
+import atexit
 import time
+import json
+import mmap
 import shutil
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from datetime import datetime
+from functools import cached_property
+from itertools import chain, repeat
 from typing import List, Dict, Any, Optional
 
 from qdrant_client import QdrantClient
-from qdrant_client.models import Distance, VectorParams, CollectionDescription
+from qdrant_client.models import (
+    Distance, VectorParams, CollectionDescription, PointStruct, ScoredPoint, QueryRequest,
+    OptimizersConfigDiff, HnswConfigDiff, KeywordIndexParams, KeywordIndexType,
+    Filter, FieldCondition, MatchAny, FilterSelector, HasIdCondition,
+    ScalarQuantization, ScalarQuantizationConfig, ScalarType, SearchParams, QuantizationSearchParams
+)
 from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_community.vectorstores import Qdrant
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_community.embeddings import FastEmbedEmbeddings
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.retrievers import BaseRetriever
+
+from .chunking import CHUNKING_VERSION, split_document
+
+def _chunk_id(source: str, page_content: str) -> int:
+    """Derive a stable 64-bit point ID from a chunk's source file and text"""
+    digest = hashlib.sha256(f"{source}\0{page_content}".encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big")
+
+def _point_to_document(point: ScoredPoint) -> Document:
+    """Convert a Qdrant hit back into the Document it was built from"""
+    return Document(
+        page_content=point.payload.get("page_content", ""),
+        metadata=point.payload.get("metadata", {})
+    )
 
 class BankingDBManager:
     """Manager for the Banking Knowledge Vector Database"""
@@ -24,7 +52,10 @@ class BankingDBManager:
                 knowledge_dir: str = "knowledge", 
                 db_path: str = "vector_db", 
                 collection_name: str = "banking_knowledge",
-                embedding_model: str = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"):
+                embedding_model: str = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2",
+                hnsw_m: int = 12,
+                hnsw_ef_construct: int = 64,
+                full_scan_threshold: int = 5000):
         """
         Initialize the Database Manager
         
@@ -33,11 +64,17 @@ class BankingDBManager:
             db_path: Directory for the vector database
             collection_name: Name of the collection in Qdrant
             embedding_model: HuggingFace model to use for embeddings
+            hnsw_m: HNSW graph edges per node (sized for <100K chunks)
+            hnsw_ef_construct: HNSW neighbours considered while building the index
+            full_scan_threshold: Size (KB) below which Qdrant uses exact search instead of HNSW
         """
         self.knowledge_dir = knowledge_dir
         self.db_path = db_path
         self.collection_name = collection_name
         self.embedding_model = embedding_model
+        self.hnsw_m = hnsw_m
+        self.hnsw_ef_construct = hnsw_ef_construct
+        self.full_scan_threshold = full_scan_threshold
         
         # Create directories if they don't exist
         if not os.path.exists(self.knowledge_dir):
@@ -45,20 +82,66 @@ class BankingDBManager:
         if not os.path.exists(self.db_path):
             os.makedirs(self.db_path)
             
-    def get_client(self) -> QdrantClient:
-        """Get a Qdrant client for the database"""
-        return QdrantClient(path=self.db_path)
+    @cached_property
+    def client(self) -> QdrantClient:
+        """Qdrant client for the database, opened once per manager"""
+        client = QdrantClient(path=self.db_path)
+        atexit.register(client.close)
+        return client
+        
+    @cached_property
+    def embeddings(self) -> Embeddings:
+        """
+        Embeddings model, loaded once per manager
+        
+        Runs the ONNX model through fastembed on CPU; set EMBED_DEVICE to a
+        GPU device (e.g. "cuda") to use PyTorch in FP16 instead.
+        """
+        device = os.environ.get("EMBED_DEVICE", "cpu")
+        if device != "cpu":
+            return HuggingFaceEmbeddings(
+                model_name=self.embedding_model,
+                model_kwargs={"device": device, "model_kwargs": {"torch_dtype": "float16"}},
+                encode_kwargs={"batch_size": 64, "normalize_embeddings": True}
+            )
+        return FastEmbedEmbeddings(
+            model_name=self.embedding_model,
+            threads=os.cpu_count(),
+            batch_size=64
+        )
+        
+    def _close_client(self) -> None:
+        """Close the cached client so the storage folder can be modified"""
+        client = self.__dict__.pop("client", None)
+        if client is not None:
+            client.close()
+        
+    def _save_last_update(self) -> None:
+        """Store the rebuild time as a single point in the collection's __meta companion"""
+        meta_collection = f"{self.collection_name}__meta"
+        if not self.client.collection_exists(meta_collection):
+            self.client.create_collection(
+                collection_name=meta_collection,
+                vectors_config=VectorParams(size=1, distance=Distance.DOT)
+            )
+        self.client.upsert(
+            collection_name=meta_collection,
+            points=[PointStruct(id=0, vector=[0.0], payload={"last_update": time.time(), "chunking": CHUNKING_VERSION})]
+        )
         
-    def get_embeddings(self) -> HuggingFaceEmbeddings:
-        """Get the embeddings model"""
-        return HuggingFaceEmbeddings(model_name=self.embedding_model)
+    def _stored_chunking(self) -> Optional[str]:
+        """Chunking settings recorded by the last rebuild, or None if there is no record"""
+        meta_collection = f"{self.collection_name}__meta"
+        if not self.client.collection_exists(meta_collection):
+            return None
+        points = self.client.retrieve(collection_name=meta_collection, ids=[0])
+        return points[0].payload.get("chunking") if points else None
         
     def list_collections(self) -> List[str]:
-        """List all collections in the database"""
+        """List all collections in the database, leaving out the internal __meta companions"""
         try:
-            client = self.get_client()
-            collections = client.get_collections().collections
-            return [collection.name for collection in collections]
+            collections = self.client.get_collections().collections
+            return [collection.name for collection in collections if not collection.name.endswith("__meta")]
         except Exception as e:
             print(f"Error listing collections: {str(e)}")
             return []
@@ -67,8 +150,7 @@ class BankingDBManager:
         """Get information about a collection"""
         name = collection_name or self.collection_name
         try:
-            client = self.get_client()
-            info = client.get_collection(name)
+            info = self.client.get_collection(name)
             return {
                 "name": name,
                 "vectors_count": info.vectors_count,
@@ -103,6 +185,7 @@ class BankingDBManager:
             
         try:
             # Remove current DB if it exists
+            self._close_client()
             if os.path.exists(self.db_path):
                 shutil.rmtree(self.db_path)
                 
@@ -115,6 +198,7 @@ class BankingDBManager:
     def delete_database(self) -> str:
         """Delete the entire vector database"""
         try:
+            self._close_client()
             if os.path.exists(self.db_path):
                 shutil.rmtree(self.db_path)
                 return f"Database at {self.db_path} has been deleted"
@@ -123,12 +207,52 @@ class BankingDBManager:
         except Exception as e:
             return f"Error deleting database: {str(e)}"
             
+    def _load_manifest(self) -> Dict[str, List[float]]:
+        """Load the file fingerprints recorded by the last rebuild"""
+        manifest_path = os.path.join(self.db_path, "manifest.json")
+        if not os.path.exists(manifest_path):
+            return {}
+        try:
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"Error reading manifest: {str(e)}")
+            return {}
+            
+    def _save_manifest(self, manifest: Dict[str, List[float]]) -> None:
+        """Record file fingerprints (mtime, size) for the next rebuild"""
+        with open(os.path.join(self.db_path, "manifest.json"), "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+            
+    def _load_document(self, file_path: str) -> Optional[Dict[str, Any]]:
+        """Read a knowledge file into a document dict, or None on failure"""
+        try:
+            with open(file_path, 'rb') as file:
+                # Decode straight from the page cache instead of through a read buffer
+                if os.fstat(file.fileno()).st_size == 0:
+                    content = ""
+                else:
+                    with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                        content = str(mm[:], 'utf-8')
+                return {
+                    "page_content": content,
+                    "metadata": {
+                        "source": os.path.basename(file_path),
+                        "file_path": file_path,
+                        "modified_time": os.path.getmtime(file_path)
+                    }
+                }
+        except Exception as e:
+            print(f"Error reading file {file_path}: {str(e)}")
+            return None
+            
     def rebuild_database(self, force: bool = True) -> Dict[str, Any]:
         """
         Rebuild the vector database from knowledge files
         
         Args:
-            force: Whether to force rebuild even if no changes detected
+            force: Whether to force a full rebuild; otherwise only changed,
+                new and removed files are re-indexed
             
         Returns:
             Dictionary with rebuild status and information
@@ -137,7 +261,8 @@ class BankingDBManager:
         
         try:
             # Get text files
-            text_files = glob.glob(os.path.join(self.knowledge_dir, "*.txt"))
+            with os.scandir(self.knowledge_dir) as entries:
+                text_files = [entry.path for entry in entries if entry.is_file() and entry.name.endswith(".txt")]
             
             if not text_files:
                 return {
@@ -146,83 +271,191 @@ class BankingDBManager:
                     "time_taken": time.time() - start_time
                 }
                 
-            # Load documents
-            documents = []
+            # Fingerprint knowledge files and compare against the last build
+            manifest = {}
             for file_path in text_files:
-                try:
-                    with open(file_path, 'r', encoding='utf-8') as file:
-                        content = file.read()
-                        documents.append({
-                            "page_content": content,
-                            "metadata": {
-                                "source": os.path.basename(file_path),
-                                "file_path": file_path,
-                                "modified_time": os.path.getmtime(file_path)
-                            }
-                        })
-                except Exception as e:
-                    print(f"Error reading file {file_path}: {str(e)}")
+                stat = os.stat(file_path)
+                manifest[os.path.basename(file_path)] = [stat.st_mtime, stat.st_size]
+                
+            previous = {} if force else self._load_manifest()
+            # Chunks from other chunking settings cannot be mixed with new ones, so those need a full rebuild
+            incremental = (
+                bool(previous)
+                and self.client.collection_exists(self.collection_name)
+                and self._stored_chunking() == CHUNKING_VERSION
+            )
+            removed = []
+            
+            if incremental:
+                removed = [name for name in previous if name not in manifest]
+                text_files = [
+                    file_path for file_path in text_files
+                    if previous.get(os.path.basename(file_path)) != manifest[os.path.basename(file_path)]
+                ]
+                
+                if not text_files and not removed:
+                    return {
+                        "status": "success",
+                        "message": "No changes detected in knowledge files",
+                        "chunks": 0,
+                        "files": 0,
+                        "time_taken": time.time() - start_time
+                    }
+                
+            # Load documents, overlapping file open/read latency across threads
+            with ThreadPoolExecutor(max_workers=max(1, min(32, len(text_files)))) as executor:
+                documents = [doc for doc in executor.map(self._load_document, text_files) if doc]
+                
+            # Files that could not be read keep their previous fingerprint (or none), so their
+            # indexed points are left alone and they are retried on the next rebuild
+            loaded = {doc["metadata"]["source"] for doc in documents}
+            for file_path in text_files:
+                name = os.path.basename(file_path)
+                if name not in loaded:
+                    if name in previous:
+                        manifest[name] = previous[name]
+                    else:
+                        manifest.pop(name)
             
-            if not documents:
+            if not documents and not incremental:
                 return {
                     "status": "error",
                     "message": "No documents successfully loaded",
                     "time_taken": time.time() - start_time
                 }
                 
-            # Split documents
-            text_splitter = RecursiveCharacterTextSplitter(
-                chunk_size=1000,
-                chunk_overlap=200,
-                length_function=len,
-                add_start_index=True,
-                separators=["\n\n", "\n", ". ", " ", ""]
-            )
-            
-            splits = []
-            for doc in documents:
-                chunks = text_splitter.create_documents(
-                    texts=[doc["page_content"]],
-                    metadatas=[doc["metadata"]]
-                )
-                splits.extend(chunks)
+            # Split documents across processes, with the same token-sized chunks RAGTool builds
+            contents = [doc["page_content"] for doc in documents]
+            metadatas = [doc["metadata"] for doc in documents]
+            if len(documents) > 1:
+                with ProcessPoolExecutor(max_workers=min(len(documents), os.cpu_count() or 1)) as executor:
+                    splits = list(chain.from_iterable(executor.map(split_document, contents, metadatas, repeat(self.embedding_model))))
+            else:
+                splits = list(chain.from_iterable(map(split_document, contents, metadatas, repeat(self.embedding_model))))
+                
+            if not splits and not incremental:
+                return {
+                    "status": "error",
+                    "message": "No chunks produced from knowledge files",
+                    "time_taken": time.time() - start_time
+                }
                 
-            # Get embeddings
-            embeddings = self.get_embeddings()
+            embeddings = self.embeddings
+            client = self.client
             
-            # Get client
-            client = self.get_client()
+            # Stable point IDs: unchanged chunks map to the same point across rebuilds
+            point_ids = [_chunk_id(split.metadata["source"], split.page_content) for split in splits]
+            reused_vectors = {}
             
-            # Check if collection exists and delete if needed
-            try:
-                collections = self.list_collections()
-                if self.collection_name in collections:
-                    client.delete_collection(self.collection_name)
-                    print(f"Deleted existing collection: {self.collection_name}")
-            except Exception as e:
-                print(f"Error checking/deleting collection: {str(e)}")
+            if incremental:
+                # Reuse stored vectors of chunks that are already indexed
+                if point_ids:
+                    existing = client.retrieve(
+                        collection_name=self.collection_name,
+                        ids=list(set(point_ids)),
+                        with_payload=False,
+                        with_vectors=True
+                    )
+                    reused_vectors = {point.id: point.vector for point in existing}
+                    
+                # Drop stale points of changed and removed files
+                stale_sources = removed + sorted(loaded)
+                client.delete(
+                    collection_name=self.collection_name,
+                    points_selector=FilterSelector(
+                        filter=Filter(
+                            must=[FieldCondition(key="metadata.source", match=MatchAny(any=stale_sources))],
+                            must_not=[HasIdCondition(has_id=point_ids)]
+                        )
+                    )
+                )
+            else:
+                # Delete the collection if it exists
+                try:
+                    if client.collection_exists(self.collection_name):
+                        client.delete_collection(self.collection_name)
+                        print(f"Deleted existing collection: {self.collection_name}")
+                    client.delete_collection(f"{self.collection_name}__meta")
+                except Exception as e:
+                    print(f"Error checking/deleting collection: {str(e)}")
                 
-            # Create collection
-            vector_size = len(embeddings.embed_query("test"))
-            client.create_collection(
-                collection_name=self.collection_name,
-                vectors_config=VectorParams(size=vector_size, distance=Distance.COSINE)
-            )
-            
-            # Create vector store
-            vectordb = Qdrant.from_documents(
-                documents=splits,
-                embedding=embeddings,
-                location=self.db_path,
-                collection_name=self.collection_name,
-                force_recreate=True
-            )
+            if splits:
+                # Embed only new chunks, in batched forward passes
+                missing = [i for i, point_id in enumerate(point_ids) if point_id not in reused_vectors]
+                new_vectors = embeddings.embed_documents([splits[i].page_content for i in missing]) if missing else []
+                vectors = [reused_vectors.get(point_id) for point_id in point_ids]
+                for i, vector in zip(missing, new_vectors):
+                    vectors[i] = vector
+                
+                if not incremental:
+                    # Create collection
+                    vector_size = len(vectors[0])
+                    client.create_collection(
+                        collection_name=self.collection_name,
+                        vectors_config=VectorParams(size=vector_size, distance=Distance.COSINE, on_disk=True),
+                        optimizers_config=OptimizersConfigDiff(indexing_threshold=0),  # No indexing during bulk load
+                        on_disk_payload=True,
+                        hnsw_config=HnswConfigDiff(
+                            m=self.hnsw_m,
+                            ef_construct=self.hnsw_ef_construct,
+                            full_scan_threshold=self.full_scan_threshold,
+                            on_disk=True
+                        ),
+                        # Only the quantized vectors are kept in RAM; search rescores from disk
+                        quantization_config=ScalarQuantization(
+                            scalar=ScalarQuantizationConfig(type=ScalarType.INT8, quantile=0.99, always_ram=True)
+                        )
+                    )
+                    
+                    # Index the source file name for filtered search and deletes by source
+                    client.create_payload_index(
+                        collection_name=self.collection_name,
+                        field_name="metadata.source",
+                        field_schema=KeywordIndexParams(type=KeywordIndexType.KEYWORD, on_disk=True)
+                    )
+                
+                # Upload vectors in batches; payloads are refreshed for reused chunks too
+                points = [
+                    PointStruct(
+                        id=point_id,
+                        vector=vector,
+                        payload={
+                            "page_content": split.page_content,
+                            "metadata": split.metadata
+                        }
+                    )
+                    for point_id, split, vector in zip(point_ids, splits, vectors)
+                ]
+                client.upload_points(
+                    collection_name=self.collection_name,
+                    points=points,
+                    batch_size=64
+                )
+                
+                if not incremental:
+                    # Build the index once all points are in
+                    client.update_collection(
+                        collection_name=self.collection_name,
+                        optimizer_config=OptimizersConfigDiff(indexing_threshold=20000)
+                    )
             
-            # Save the last update time
-            with open(os.path.join(self.db_path, "last_update.txt"), "w") as f:
-                f.write(str(time.time()))
+            # Save the last update time and file fingerprints
+            self._save_last_update()
+            self._save_manifest(manifest)
                 
             time_taken = time.time() - start_time
+            
+            if incremental:
+                return {
+                    "status": "success",
+                    "message": (
+                        f"Database updated with {len(splits)} chunks from {len(text_files)} changed files, "
+                        f"{len(removed)} files removed"
+                    ),
+                    "chunks": len(splits),
+                    "files": len(text_files),
+                    "time_taken": time_taken
+                }
                 
             return {
                 "status": "success",
@@ -239,38 +472,85 @@ class BankingDBManager:
                 "time_taken": time.time() - start_time
             }
             
-    def get_retriever(self):
+    def get_retriever(self) -> Optional["KnowledgeRetriever"]:
         """Get a retriever for the vector database"""
         try:
-            client = self.get_client()
-            embeddings = self.get_embeddings()
-            
             # Check if collection exists
-            collections = self.list_collections()
-            if self.collection_name not in collections:
+            if not self.client.collection_exists(self.collection_name):
                 print(f"Collection {self.collection_name} does not exist. Rebuilding database...")
                 result = self.rebuild_database()
                 if result["status"] != "success":
                     raise Exception(result["message"])
                     
-            # Load vector store
-            vectordb = Qdrant(
-                client=client,
-                collection_name=self.collection_name,
-                embedding_function=embeddings
-            )
-            
-            # Return retriever
-            return vectordb.as_retriever(
-                search_type="mmr",
-                search_kwargs={
-                    "k": 5,
-                    "fetch_k": 10,
-                    "lambda_mult": 0.5,
-                    "score_threshold": 0.3
-                }
-            )
+            return KnowledgeRetriever(db_manager=self)
             
         except Exception as e:
             print(f"Error getting retriever: {str(e)}")
-            return None
\ No newline at end of file
+            return None
+            
+    def batch_search(self, queries: List[str], k: int = 5, score_threshold: float = 0.3) -> List[List[Document]]:
+        """
+        Search the knowledge base for several queries in one round-trip
+        
+        Args:
+            queries: Questions to search for
+            k: Number of documents to return per query
+            score_threshold: Minimum cosine similarity of returned documents
+            
+        Returns:
+            One list of matching documents per query, in query order
+        """
+        if not queries:
+            return []
+            
+        vectors = self.embeddings.embed_documents(queries)
+        responses = self.client.query_batch_points(
+            collection_name=self.collection_name,
+            requests=[
+                QueryRequest(
+                    query=vector,
+                    limit=k,
+                    score_threshold=score_threshold,
+                    with_payload=True,
+                    params=SearchParams(quantization=QuantizationSearchParams(rescore=True, oversampling=2.0))
+                )
+                for vector in vectors
+            ]
+        )
+        return [[_point_to_document(point) for point in response.points] for response in responses]
+        
+    def search(self, query: str, k: int = 5, score_threshold: float = 0.3) -> List[Document]:
+        """
+        Search the knowledge base for a single query
+        
+        Args:
+            query: Question to search for
+            k: Number of documents to return
+            score_threshold: Minimum cosine similarity of returned documents
+            
+        Returns:
+            Matching documents, most similar first
+        """
+        response = self.client.query_points(
+            collection_name=self.collection_name,
+            query=self.embeddings.embed_query(query),
+            limit=k,
+            score_threshold=score_threshold,
+            with_payload=True,
+            # Search the int8 vectors, then rescore the top candidates with full precision
+            search_params=SearchParams(quantization=QuantizationSearchParams(rescore=True, oversampling=2.0))
+        )
+        return [_point_to_document(point) for point in response.points]
+
+
+class KnowledgeRetriever(BaseRetriever):
+    """LangChain retriever that queries the knowledge collection through BankingDBManager.search"""
+    
+    db_manager: Any
+    k: int = 5
+    score_threshold: float = 0.3
+    
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        return self.db_manager.search(query, k=self.k, score_threshold=self.score_threshold)
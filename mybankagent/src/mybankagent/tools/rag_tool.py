@@ -1,18 +1,243 @@
 from crewai.tools import BaseTool
-from typing import Type, Optional, List
+from typing import Type, Optional, List, Dict, Any, Set, Tuple, Callable, Iterable, Iterator
 from pydantic import BaseModel, Field
 import os
-import glob
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_community.vectorstores import Qdrant
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+import mmap
+import time
+from collections import deque
+from concurrent.futures import Executor, ThreadPoolExecutor
+from functools import lru_cache
+from itertools import chain, islice
+import hashlib
+import json
+import sqlite3
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from fastembed import TextEmbedding
+from langchain_core.documents import Document
 from qdrant_client import QdrantClient
-from qdrant_client.models import Distance, VectorParams
+from qdrant_client.models import (
+    Distance, VectorParams, PointStruct, HnswConfigDiff, ScalarQuantization, ScalarQuantizationConfig,
+    ScalarType, BinaryQuantization, BinaryQuantizationConfig, SearchParams, QuantizationSearchParams, QueryRequest
+)
+
+from .chunking import CHUNKING_VERSION, split_document
+
+# Binary quantization by default; set RAG_QUANTIZATION=int8 to fall back to scalar
+# quantization if binary recall is too low for a corpus
+if os.environ.get("RAG_QUANTIZATION", "binary") == "int8":
+    _QUANTIZATION_CONFIG = ScalarQuantization(
+        scalar=ScalarQuantizationConfig(type=ScalarType.INT8, quantile=0.99, always_ram=True)
+    )
+    _OVERSAMPLING = 2.0
+else:
+    _QUANTIZATION_CONFIG = BinaryQuantization(binary=BinaryQuantizationConfig(always_ram=True))
+    _OVERSAMPLING = 3.0
+
+# Search the quantized vectors, then rescore the best candidates with the originals
+_QUANTIZED_SEARCH_PARAMS = SearchParams(
+    hnsw_ef=64,
+    quantization=QuantizationSearchParams(rescore=True, oversampling=_OVERSAMPLING)
+)
+
+# Corpora up to this many chunks are searched by brute force in NumPy instead of through a Qdrant index
+_BRUTE_FORCE_MAX_CHUNKS = int(os.environ.get("RAG_BRUTE_FORCE_MAX_CHUNKS", "10000"))
+
+_EMBEDDING_MODEL = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+
+class OnnxEmbeddings(Embeddings):
+    """LangChain embeddings running fastembed's quantized ONNX export of the model on CPU."""
+    
+    def __init__(self, model_name: str, batch_size: int = 64, num_threads: Optional[int] = None):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        
+        # ONNX Runtime sizes its thread pool to the physical cores when num_threads is None
+        self.model = TextEmbedding(model_name=model_name, threads=num_threads)
+        
+        # Run one embed up front so the first query does not pay for session warm-up
+        list(self.model.embed(["warm-up"]))
+    
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed a batch of texts."""
+        return [vector.tolist() for vector in self.model.embed(texts, batch_size=self.batch_size)]
+    
+    def embed_query(self, text: str) -> List[float]:
+        """Embed a single query."""
+        return next(iter(self.model.query_embed(text))).tolist()
+
+class _EmbCache:
+    """On-disk cache of chunk embeddings keyed by a hash of (model, chunk text)."""
+    
+    def __init__(self, path: str):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS emb (hash BLOB PRIMARY KEY, vec BLOB)")
+    
+    @staticmethod
+    def key(model_name: str, text: str) -> bytes:
+        """Cache key for a chunk embedded with the given model."""
+        return hashlib.blake2b((model_name + text).encode("utf-8"), digest_size=32).digest()
+    
+    def get_many(self, keys: List[bytes]) -> Dict[bytes, np.ndarray]:
+        """Fetch the cached vectors for the given keys."""
+        found = {}
+        unique_keys = list(set(keys))
+        for start in range(0, len(unique_keys), 500):  # Stay under SQLite's bound-parameter limit
+            batch = unique_keys[start:start + 500]
+            rows = self.conn.execute(
+                f"SELECT hash, vec FROM emb WHERE hash IN ({','.join('?' * len(batch))})", batch
+            )
+            found.update((key, np.frombuffer(vec, dtype=np.float32)) for key, vec in rows)
+        return found
+    
+    def put_many(self, entries: Dict[bytes, np.ndarray]) -> None:
+        """Store new vectors."""
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO emb (hash, vec) VALUES (?, ?)",
+                [(key, vector.tobytes()) for key, vector in entries.items()]
+            )
+    
+    def prune(self, keep: Set[bytes]) -> int:
+        """Delete vectors whose keys are not in keep; returns the number of rows removed."""
+        with self.conn:
+            self.conn.execute("CREATE TEMP TABLE keep (hash BLOB PRIMARY KEY)")
+            self.conn.executemany("INSERT OR IGNORE INTO keep (hash) VALUES (?)", [(key,) for key in keep])
+            removed = self.conn.execute("DELETE FROM emb WHERE hash NOT IN (SELECT hash FROM keep)").rowcount
+            self.conn.execute("DROP TABLE keep")
+        return removed
+    
+    def close(self) -> None:
+        self.conn.close()
+
+def _file_digest(file_path: str) -> str:
+    """BLAKE2b digest of a file's contents, hashed straight from a memory map."""
+    with open(file_path, 'rb') as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            return hashlib.blake2b(digest_size=32).hexdigest()
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return hashlib.blake2b(mm, digest_size=32).hexdigest()
+
+@lru_cache(maxsize=None)
+def _get_embeddings(model_name: str) -> OnnxEmbeddings:
+    """Load an embeddings model once per process."""
+    return OnnxEmbeddings(model_name=model_name)
+
+@lru_cache(maxsize=None)
+def _get_client(db_path: str) -> QdrantClient:
+    """Open one Qdrant client per storage folder; the local store allows only one."""
+    return QdrantClient(path=db_path)
+
+# Retrievers already built in this process, keyed by (knowledge_dir, db_path, collection_name)
+_RETRIEVERS: Dict[Tuple[str, str, str], Any] = {}
+
+class _QdrantRetriever:
+    """Server-side top-k search over a knowledge collection, returning only the payload fields _run needs."""
+    
+    def __init__(self, client: QdrantClient, embeddings: Embeddings, collection_name: str):
+        self.client = client
+        self.embed_query = embeddings.embed_query
+        self.embed_documents = embeddings.embed_documents
+        self.collection_name = collection_name
+    
+    def search(self, query: str, limit: int = 5, score_threshold: float = 0.3) -> List[Dict[str, Any]]:
+        """Return the payloads of the chunks most similar to the query."""
+        hits = self.client.query_points(
+            collection_name=self.collection_name,
+            query=self.embed_query(query),
+            limit=limit,
+            score_threshold=score_threshold,
+            search_params=_QUANTIZED_SEARCH_PARAMS,
+            with_payload=["page_content", "metadata"]
+        ).points
+        return [hit.payload for hit in hits]
+    
+    def search_batch(self, queries: List[str], limit: int = 5, score_threshold: float = 0.3) -> List[List[Dict[str, Any]]]:
+        """Return the payloads for each query, embedding all queries in one pass and searching in one request."""
+        responses = self.client.query_batch_points(
+            collection_name=self.collection_name,
+            requests=[
+                QueryRequest(
+                    query=query_vector,
+                    limit=limit,
+                    score_threshold=score_threshold,
+                    params=_QUANTIZED_SEARCH_PARAMS,
+                    with_payload=["page_content", "metadata"]
+                )
+                for query_vector in self.embed_documents(queries)
+            ]
+        )
+        return [[hit.payload for hit in response.points] for response in responses]
+
+def _quantize_int8(matrix: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Symmetric int8 quantization with one scale per row; returns (codes, scales)."""
+    scales = np.maximum(np.abs(matrix).max(axis=1), 1e-12) / 127
+    codes = np.round(matrix / scales[:, np.newaxis]).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+class _NumpyRetriever:
+    """Top-k cosine search over an in-process int8 matrix, for corpora too small to need an index."""
+    
+    def __init__(self, vectors: Iterable, payloads: List[Dict[str, Any]], embeddings: Embeddings):
+        matrix = np.array(vectors, dtype=np.float32)
+        matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+        
+        # Keep the matrix as int8 codes with one scale per row, a quarter of the float32 size
+        self.codes, self.scales = _quantize_int8(matrix)
+        self.payloads = payloads
+        self.embed_documents = embeddings.embed_documents
+    
+    def search(self, query: str, limit: int = 5, score_threshold: float = 0.3) -> List[Dict[str, Any]]:
+        """Return the payloads of the chunks most similar to the query."""
+        return self.search_batch([query], limit, score_threshold)[0]
+    
+    def search_batch(self, queries: List[str], limit: int = 5, score_threshold: float = 0.3) -> List[List[Dict[str, Any]]]:
+        """Return the payloads for each query, embedding all queries in one pass and scoring them together."""
+        query_matrix = np.array(self.embed_documents(queries), dtype=np.float32)
+        query_matrix /= np.maximum(np.linalg.norm(query_matrix, axis=1, keepdims=True), 1e-12)
+        query_codes, query_scales = _quantize_int8(query_matrix)
+        query_codes = query_codes.astype(np.float32).T
+        
+        # Score blocks of rows through float32 BLAS; int8 products summed over 384 dimensions stay
+        # below 2**24, so the integer dot products are exact and only one block is widened at a time
+        similarities = np.empty((len(self.codes), len(queries)), dtype=np.float32)
+        for start in range(0, len(self.codes), 4096):
+            block = self.codes[start:start + 4096].astype(np.float32)
+            similarities[start:start + 4096] = block @ query_codes
+        similarities *= np.outer(self.scales, query_scales)
+        
+        results = []
+        for column in similarities.T:
+            # Partial sort: select the top candidates, then order just those
+            top = np.argpartition(-column, limit)[:limit] if len(column) > limit else np.arange(len(column))
+            top = top[np.argsort(-column[top])]
+            results.append([self.payloads[i] for i in top if column[i] >= score_threshold])
+        return results
+
+def _map_bounded(executor: Executor, fn: Callable, items: Iterable, window: int) -> Iterator:
+    """Like executor.map, but keep at most window calls submitted ahead of the consumer."""
+    items = iter(items)
+    pending = deque(executor.submit(fn, item) for item in islice(items, window))
+    while pending:
+        result = pending.popleft().result()
+        for item in islice(items, 1):
+            pending.append(executor.submit(fn, item))
+        yield result
+
+def _batched(iterable: Iterable, size: int) -> Iterator[List]:
+    """Yield lists of up to size items from iterable."""
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
 
 class RAGQueryInput(BaseModel):
     """Input schema for RAG Query Tool."""
     query: str = Field(..., description="The question to search for in the knowledge base.")
 
+class RAGBatchQueryInput(BaseModel):
+    """Input schema for the batch RAG Query Tool."""
+    queries: List[str] = Field(..., description="The questions to search for in the knowledge base, one per entry.")
+
 class RAGTool(BaseTool):
     name: str = "Knowledge Base Query Tool"
     description: str = (
@@ -29,9 +254,28 @@ class RAGTool(BaseTool):
         self.db_path = db_path
         self.collection_name = collection_name
         self.force_recreate = force_recreate
+        
+        # Reuse a retriever built by another RAGTool over the same knowledge base
+        key = (knowledge_dir, db_path, collection_name)
+        if not force_recreate and key in _RETRIEVERS:
+            self.retriever = _RETRIEVERS[key]
+            return
         self._initialize_retriever()
+        if self.retriever:
+            _RETRIEVERS[key] = self.retriever
     
-    def _should_recreate_db(self):
+    def _iter_txt(self) -> List[Tuple[str, float]]:
+        """List (path, mtime) of the knowledge text files in a single directory scan"""
+        if not os.path.isdir(self.knowledge_dir):
+            return []
+        with os.scandir(self.knowledge_dir) as entries:
+            return [
+                (entry.path, entry.stat().st_mtime)
+                for entry in entries
+                if entry.is_file() and entry.name.endswith(".txt")
+            ]
+    
+    def _should_recreate_db(self, text_files: List[Tuple[str, float]]):
         """Check if we should recreate the database"""
         # Always recreate if forced
         if self.force_recreate:
@@ -44,166 +288,243 @@ class RAGTool(BaseTool):
             
         # If we have a client, check if the collection exists
         try:
-            client = QdrantClient(path=self.db_path)
-            collections = client.get_collections().collections
-            collection_names = [collection.name for collection in collections]
+            client = _get_client(self.db_path)
             
             # If the collection doesn't exist, create it
-            if self.collection_name not in collection_names:
+            if not client.collection_exists(self.collection_name):
                 return True
                 
-            # Check if there are any knowledge files newer than the DB
-            if not os.path.exists(os.path.join(self.db_path, "last_update.txt")):
+            # The last update time is stored with the collection; a rebuild that did not finish has none
+            meta_collection = f"{self.collection_name}__meta"
+            if not client.collection_exists(meta_collection):
+                return True
+            points = client.retrieve(collection_name=meta_collection, ids=[0])
+            if not points:
                 return True
                 
-            # Check if any knowledge files were modified after DB creation
-            with open(os.path.join(self.db_path, "last_update.txt"), "r") as f:
-                last_update = float(f.read().strip())
+            # Collections chunked with other settings (or before they were recorded) are rebuilt
+            if points[0].payload.get("chunking") != CHUNKING_VERSION:
+                return True
                 
-            text_files = glob.glob(os.path.join(self.knowledge_dir, "*.txt"))
-            for file_path in text_files:
-                if os.path.getmtime(file_path) > last_update:
-                    return True
-                    
+            # Files added or removed since the last build always need a rebuild
+            hashes = self._load_hashes()
+            if set(hashes) != {file_path for file_path, _ in text_files}:
+                return True
+                
+            # Files modified after DB creation only count if their contents changed
+            last_update = points[0].payload["last_update"]
+            touched = [file_path for file_path, modified_time in text_files if modified_time > last_update]
+            if any(_file_digest(file_path) != hashes[file_path] for file_path in touched):
+                return True
+            
+            # Only mtimes moved; record that so the same files are not re-hashed on every start
+            if touched:
+                self._save_last_update(client)
             return False
         except Exception as e:
             print(f"Error checking database: {str(e)}")
             return True
     
+    def _save_last_update(self, client: QdrantClient) -> None:
+        """Store the update time and chunking settings as a single point next to the collection"""
+        meta_collection = f"{self.collection_name}__meta"
+        if not client.collection_exists(meta_collection):
+            client.create_collection(
+                collection_name=meta_collection,
+                vectors_config=VectorParams(size=1, distance=Distance.DOT)
+            )
+        client.upsert(
+            collection_name=meta_collection,
+            points=[PointStruct(id=0, vector=[0.0], payload={"last_update": time.time(), "chunking": CHUNKING_VERSION})]
+        )
+    
+    def _load_hashes(self) -> Dict[str, str]:
+        """Load the content hashes of the files in the last build"""
+        try:
+            with open(os.path.join(self.db_path, "hashes.json"), "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+    
+    def _load_and_split(self, file_path: str, modified_time: float, hashes: Dict[str, str]) -> List[Document]:
+        """Read one knowledge file, record its content hash and split it into chunks; returns no chunks if it cannot be read."""
+        try:
+            # Map the file, hash and decode straight from the page cache; empty files cannot be mapped
+            with open(file_path, 'rb') as file:
+                if os.fstat(file.fileno()).st_size == 0:
+                    content = ""
+                    hashes[file_path] = hashlib.blake2b(digest_size=32).hexdigest()
+                else:
+                    with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                        hashes[file_path] = hashlib.blake2b(mm, digest_size=32).hexdigest()
+                        content = mm[:].decode("utf-8", "ignore")
+        except Exception as e:
+            print(f"Error reading file {file_path}: {str(e)}")
+            return []
+        metadata = {
+            "source": os.path.basename(file_path),
+            "file_path": file_path,
+            "modified_time": modified_time
+        }
+        return split_document(content, metadata, _EMBEDDING_MODEL)
+    
+    def _make_retriever(self, client: QdrantClient, embeddings: Embeddings):
+        """Search small collections by brute force in NumPy, larger ones through Qdrant; None if the collection is empty."""
+        point_count = client.count(self.collection_name, exact=True).count
+        if point_count == 0:
+            print(f"Collection {self.collection_name} is empty. Retriever not initialized.")
+            return None
+        if point_count > _BRUTE_FORCE_MAX_CHUNKS:
+            return _QdrantRetriever(client, embeddings, self.collection_name)
+        
+        # Pull every vector and payload out of the collection once
+        vectors, payloads = [], []
+        offset = None
+        while True:
+            points, offset = client.scroll(
+                collection_name=self.collection_name,
+                limit=1000,
+                offset=offset,
+                with_payload=["page_content", "metadata"],
+                with_vectors=True
+            )
+            vectors.extend(point.vector for point in points)
+            payloads.extend(point.payload for point in points)
+            if offset is None:
+                break
+        return _NumpyRetriever(vectors, payloads, embeddings)
+    
     def _initialize_retriever(self):
         """Initialize the vector store and retriever."""
         try:
+            # Scan the knowledge directory once for both the staleness check and loading
+            text_files = self._iter_txt()
+            
             # Check if we need to recreate the database
-            if not self._should_recreate_db():
+            if not self._should_recreate_db(text_files):
                 print("Using existing vector database...")
                 # Connect to existing database
-                client = QdrantClient(path=self.db_path)
+                client = _get_client(self.db_path)
                 
                 # Initialize embeddings model
-                embeddings = HuggingFaceEmbeddings(
-                    model_name="sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
-                )
-                
-                # Load existing vector store
-                vectordb = Qdrant(
-                    client=client,
-                    collection_name=self.collection_name,
-                    embedding_function=embeddings
-                )
+                embeddings = _get_embeddings(_EMBEDDING_MODEL)
                 
-                # Initialize retriever
-                self.retriever = vectordb.as_retriever(
-                    search_type="mmr",
-                    search_kwargs={
-                        "k": 5,
-                        "fetch_k": 10,
-                        "lambda_mult": 0.5,
-                        "score_threshold": 0.3
-                    }
-                )
-                print(f"Successfully connected to existing vector database at {self.db_path}")
+                # Search the existing collection directly
+                self.retriever = self._make_retriever(client, embeddings)
+                if self.retriever:
+                    print(f"Successfully connected to existing vector database at {self.db_path}")
                 return
             
             # Recreate the database
             print("Creating new vector database...")
             
-            # Collect all text files from the knowledge directory
-            text_files = glob.glob(os.path.join(self.knowledge_dir, "*.txt"))
-            
             if not text_files:
                 print(f"No text files found in {self.knowledge_dir}. Retriever not initialized.")
                 return
             
-            # Load and process documents
-            documents = []
-            for file_path in text_files:
-                try:
-                    with open(file_path, 'r', encoding='utf-8') as file:
-                        content = file.read()
-                        documents.append({
-                            "page_content": content,
-                            "metadata": {
-                                "source": os.path.basename(file_path),
-                                "file_path": file_path,
-                                "modified_time": os.path.getmtime(file_path)
-                            }
-                        })
-                except Exception as e:
-                    print(f"Error reading file {file_path}: {str(e)}")
-            
-            if not documents:
-                print("No documents successfully loaded. Retriever not initialized.")
-                return
-            
-            # Split documents into chunks
-            text_splitter = RecursiveCharacterTextSplitter(
-                chunk_size=1000,
-                chunk_overlap=200,
-                length_function=len,
-                add_start_index=True,
-                separators=["\n\n", "\n", ". ", " ", ""]
-            )
-            
-            splits = []
-            for doc in documents:
-                chunks = text_splitter.create_documents(
-                    texts=[doc["page_content"]],
-                    metadatas=[doc["metadata"]]
-                )
-                splits.extend(chunks)
-            
             # Initialize embeddings model
-            embeddings = HuggingFaceEmbeddings(
-                model_name="sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
-            )
+            embeddings = _get_embeddings(_EMBEDDING_MODEL)
             
             # Create vector store
-            client = QdrantClient(path=self.db_path)
+            client = _get_client(self.db_path)
             
-            # Create or recreate the collection
+            # Stream chunks from the files (read and split in parallel) through embedding and
+            # upload in fixed-size batches, so only one batch of chunks and vectors is held at a time
+            # Separate from the old emb_cache.sqlite so vectors from the previous ONNX export are not mixed in
+            cache = _EmbCache(os.path.join(self.db_path, "emb_cache_fastembed.sqlite"))
+            hashes = {}
+            used_keys = set()
+            chunk_count = 0
+            embedded_count = 0
             try:
-                client.get_collection(self.collection_name)
-                client.delete_collection(self.collection_name)
-                print(f"Deleted existing collection: {self.collection_name}")
-            except Exception:
-                # Collection doesn't exist, which is fine
-                pass
+                workers = min(32, (os.cpu_count() or 1) * 4)
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    # Only a few files are read ahead of embedding, so their chunks do not pile up in memory
+                    chunks = chain.from_iterable(_map_bounded(
+                        executor,
+                        lambda text_file: self._load_and_split(*text_file, hashes),
+                        text_files,
+                        window=2 * workers
+                    ))
+                    for batch in _batched(chunks, 64):
+                        # Look up cached vectors and embed only chunks not seen before
+                        keys = [_EmbCache.key(embeddings.model_name, chunk.page_content) for chunk in batch]
+                        used_keys.update(keys)
+                        cached = cache.get_many(keys)
+                        missing = list({key: chunk.page_content for key, chunk in zip(keys, batch) if key not in cached}.items())
+                        if missing:
+                            new_vectors = embeddings.embed_documents([text for _, text in missing])
+                            new_entries = {key: np.asarray(vector, dtype=np.float32) for (key, _), vector in zip(missing, new_vectors)}
+                            cache.put_many(new_entries)
+                            cached.update(new_entries)
+                            embedded_count += len(missing)
+                        vectors = np.stack([cached[key] for key in keys])
+                        
+                        if chunk_count == 0:
+                            # Replace any existing collection, sized from the first vectors
+                            if client.collection_exists(self.collection_name):
+                                client.delete_collection(self.collection_name)
+                                print(f"Deleted existing collection: {self.collection_name}")
+                            client.delete_collection(f"{self.collection_name}__meta")
+                            client.create_collection(
+                                collection_name=self.collection_name,
+                                # Original vectors, payloads and the graph stay on disk; only the
+                                # quantized vectors are kept in RAM for search
+                                vectors_config=VectorParams(size=vectors.shape[1], distance=Distance.COSINE, on_disk=True),
+                                hnsw_config=HnswConfigDiff(on_disk=True),
+                                on_disk_payload=True,
+                                quantization_config=_QUANTIZATION_CONFIG
+                            )
+                        
+                        client.upload_collection(
+                            collection_name=self.collection_name,
+                            vectors=vectors,
+                            payload=[{"page_content": chunk.page_content, "metadata": chunk.metadata} for chunk in batch],
+                            ids=list(range(chunk_count, chunk_count + len(batch)))
+                        )
+                        chunk_count += len(batch)
                 
-            # Create the collection with the right vector size
-            vector_size = len(embeddings.embed_query("test"))
-            client.create_collection(
-                collection_name=self.collection_name,
-                vectors_config=VectorParams(size=vector_size, distance=Distance.COSINE)
-            )
+                if chunk_count:
+                    # Drop vectors of chunks that are no longer part of the knowledge base
+                    pruned = cache.prune(used_keys)
+                    if pruned:
+                        print(f"Pruned {pruned} unused cached vectors")
+            finally:
+                cache.close()
             
-            # Create vector store
-            vectordb = Qdrant.from_documents(
-                documents=splits,
-                embedding=embeddings,
-                location=self.db_path,  # Disk-based storage
-                collection_name=self.collection_name,
-                force_recreate=True  # Create new collection
-            )
+            # The cache of the previous ONNX export is never read again
+            legacy_cache = os.path.join(self.db_path, "emb_cache.sqlite")
+            if chunk_count and os.path.exists(legacy_cache):
+                os.remove(legacy_cache)
             
-            # Save the last update time
-            with open(os.path.join(self.db_path, "last_update.txt"), "w") as f:
-                import time
-                f.write(str(time.time()))
+            if not chunk_count:
+                print("No documents successfully loaded. Retriever not initialized.")
+                return
+            print(f"Embedded {embedded_count} new chunks, reused {chunk_count - embedded_count} cached vectors")
+            
+            # Save the content hashes and the last update time
+            with open(os.path.join(self.db_path, "hashes.json"), "w") as f:
+                json.dump(hashes, f)
+            self._save_last_update(client)
             
             # Initialize retriever
-            self.retriever = vectordb.as_retriever(
-                search_type="mmr",  # Maximal Marginal Relevance
-                search_kwargs={
-                    "k": 5,  # Number of documents to return
-                    "fetch_k": 10,  # More docs to consider initially
-                    "lambda_mult": 0.5,  # Balance relevance and diversity
-                    "score_threshold": 0.3  # Minimum similarity threshold
-                }
-            )
-            print(f"Retriever successfully initialized with {len(splits)} chunks from {len(text_files)} files.")
+            self.retriever = self._make_retriever(client, embeddings)
+            print(f"Retriever successfully initialized with {chunk_count} chunks from {len(text_files)} files.")
         except Exception as e:
             print(f"Error initializing vector store: {str(e)}")
     
+    def _format_hits(self, hits: List[Dict[str, Any]]) -> str:
+        """Format retrieved payloads as source and content blocks."""
+        if not hits:
+            return "No relevant banking information found in the knowledge base."
+        
+        results = []
+        for payload in hits:
+            source = payload.get("metadata", {}).get("source", "Unknown")
+            results.append(f"Source: {source}\n\nContent:\n{payload.get('page_content', '')}\n")
+        
+        return "\n---\n".join(results)
+    
     def _run(self, query: str) -> str:
         """Run the RAG tool with the given query."""
         if not self.retriever:
@@ -211,18 +532,34 @@ class RAGTool(BaseTool):
         
         try:
             # Retrieve relevant documents
-            docs = self.retriever.get_relevant_documents(query)
-            
-            if not docs:
-                return "No relevant banking information found in the knowledge base."
-            
-            # Format results
-            results = []
-            for i, doc in enumerate(docs, 1):
-                source = doc.metadata.get("source", "Unknown")
-                results.append(f"Source: {source}\n\nContent:\n{doc.page_content}\n")
-            
-            return "\n---\n".join(results)
+            return self._format_hits(self.retriever.search(query))
+        
+        except Exception as e:
+            return f"Error querying the banking knowledge base: {str(e)}"
+    
+    def _run_batch(self, queries: List[str]) -> List[str]:
+        """Run the RAG tool for several queries, embedding and searching them together."""
+        if not self.retriever:
+            return ["Banking knowledge base is not initialized. Please check if text files exist in the knowledge directory."] * len(queries)
+        
+        try:
+            return [self._format_hits(hits) for hits in self.retriever.search_batch(queries)]
         
         except Exception as e:
-            return f"Error querying the banking knowledge base: {str(e)}"
\ No newline at end of file
+            return [f"Error querying the banking knowledge base: {str(e)}"] * len(queries)
+
+class BatchKnowledgeBaseQueryTool(BaseTool):
+    name: str = "Batch Knowledge Base Query Tool"
+    description: str = (
+        "Use this tool to look up several questions in the banking knowledge base at once. "
+        "Pass all the questions together; the results are returned in the same order."
+    )
+    args_schema: Type[BaseModel] = RAGBatchQueryInput
+    rag_tool: Any = None
+    
+    def _run(self, queries: List[str]) -> str:
+        """Run the shared RAG tool's batch query and label each result with its question."""
+        if not queries:
+            return "No queries given."
+        results = self.rag_tool._run_batch(queries)
+        return "\n===\n".join(f"Query: {query}\n\n{result}" for query, result in zip(queries, results))
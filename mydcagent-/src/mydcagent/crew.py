@@ -7,7 +7,7 @@ from typing import List, Dict, Any
 import os
 
 # Import the RAG Tool
-from tools.rag_tool import RAGTool
+from tools.rag_tool import RAGTool, BatchKnowledgeBaseQueryTool
 
 @CrewBase
 class Mycdagent():
@@ -26,29 +26,27 @@ class Mycdagent():
             model='ollama/llama3.2:3b',
             base_url='http://127.0.0.1:11434'
         )
+        
+        # Shared RAG tool so the knowledge base is loaded once for both agents
+        self._rag_tool = RAGTool(knowledge_dir=self.knowledge_dir)
+        self._batch_rag_tool = BatchKnowledgeBaseQueryTool(rag_tool=self._rag_tool)
     
     @agent
     def researcher(self) -> Agent:
-        # Create the RAG tool
-        rag_tool = RAGTool(knowledge_dir=self.knowledge_dir)
-        
         return Agent(
             config=self.agents_config['researcher'],  # type: ignore[index]
             verbose=True,
             llm=self.ollama_llm,
-            tools=[rag_tool]  # Add the RAG tool to the researcher agent
+            tools=[self._rag_tool, self._batch_rag_tool]  # Add the RAG tools to the researcher agent
         )
 
     @agent
     def reporting_analyst(self) -> Agent:
-        # Create the RAG tool
-        rag_tool = RAGTool(knowledge_dir=self.knowledge_dir)
-        
         return Agent(
             config=self.agents_config['reporting_analyst'],  # type: ignore[index]
             verbose=True,
             llm=self.ollama_llm,
-            tools=[rag_tool]  # Add the RAG tool to the reporting agent
+            tools=[self._rag_tool, self._batch_rag_tool]  # Add the RAG tools to the reporting agent
         )
 
     @task
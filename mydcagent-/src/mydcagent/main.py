@@ -39,12 +39,12 @@ def run_rag():
         print(f"Using knowledge directory: {args.knowledge_dir}")
         print("Type 'exit' to quit")
         
+        agent = Mycdagent(knowledge_dir=args.knowledge_dir)
         while True:
             question = input("\nYour question: ")
             if question.lower() in ['exit', 'quit', 'q']:
                 break
                 
-            agent = Mycdagent(knowledge_dir=args.knowledge_dir)
             answer = agent.answer_question(question, args.topic)
             print("\nAnswer:")
             print(answer)
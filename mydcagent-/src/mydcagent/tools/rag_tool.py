@@ -1,18 +1,206 @@
 # Path: mycdagent/src/mycdagent/tools/rag_tool.py
 
 from crewai.tools import BaseTool
-from typing import Type, Optional, List
+from typing import Type, Optional, List, Dict, Any, Tuple, Callable, Iterable, Iterator
 from pydantic import BaseModel, Field
 import os
-import glob
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_community.vectorstores import Qdrant
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+import mmap
+from collections import deque
+from concurrent.futures import Executor, ThreadPoolExecutor
+from functools import lru_cache
+from itertools import chain, islice
+from langchain_core.embeddings import Embeddings
+import numpy as np
+from fastembed import TextEmbedding
+from langchain_core.documents import Document
+from semantic_text_splitter import TextSplitter
+from tokenizers import Tokenizer
+from qdrant_client import QdrantClient
+from qdrant_client.models import (
+    Distance, VectorParams, ScalarQuantization, ScalarQuantizationConfig, ScalarType,
+    BinaryQuantization, BinaryQuantizationConfig, SearchParams, QuantizationSearchParams, QueryRequest
+)
+
+_EMBEDDING_MODEL = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+
+# Chunk sizes in model tokens; the model truncates input past 128 tokens when embedding
+_CHUNK_TOKENS = 128
+_CHUNK_OVERLAP_TOKENS = 16
+_MIN_CHUNK_TOKENS = 32
+
+class OnnxEmbeddings(Embeddings):
+    """LangChain embeddings running fastembed's quantized ONNX export of the model on CPU."""
+    
+    def __init__(self, model_name: str, batch_size: int = 64, num_threads: Optional[int] = None):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        
+        # ONNX Runtime sizes its thread pool to the physical cores when num_threads is None
+        self.model = TextEmbedding(model_name=model_name, threads=num_threads)
+        
+        # Run one embed up front so the first query does not pay for session warm-up
+        list(self.model.embed(["warm-up"]))
+    
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed a batch of texts."""
+        return [vector.tolist() for vector in self.model.embed(texts, batch_size=self.batch_size)]
+    
+    def embed_query(self, text: str) -> List[float]:
+        """Embed a single query."""
+        return next(iter(self.model.query_embed(text))).tolist()
+
+def _token_count(tokenizer: Tokenizer, text: str) -> int:
+    """Number of model tokens in text, excluding special tokens."""
+    return len(tokenizer.encode(text, add_special_tokens=False).ids)
+
+def _split_document(splitter: TextSplitter, tokenizer: Tokenizer, content: str, metadata: Dict[str, Any]) -> List[Document]:
+    """Split one document into token-sized chunks, folding short chunks into the previous one when they fit."""
+    chunks = []
+    for start, text in splitter.chunk_indices(content):
+        if chunks and _token_count(tokenizer, text) < _MIN_CHUNK_TOKENS:
+            previous = chunks[-1]
+            combined = content[previous.metadata["start_index"]:start + len(text)]
+            if _token_count(tokenizer, combined) <= _CHUNK_TOKENS:
+                chunks[-1] = Document(page_content=combined, metadata=previous.metadata)
+                continue
+        chunks.append(Document(page_content=text, metadata={**metadata, "start_index": start}))
+    return chunks
+
+@lru_cache(maxsize=None)
+def _get_embeddings(model_name: str) -> OnnxEmbeddings:
+    """Load an embeddings model once per process."""
+    return OnnxEmbeddings(model_name=model_name)
+
+# Retrievers already built in this process, keyed by knowledge_dir
+_RETRIEVERS: Dict[str, Any] = {}
+
+# Binary quantization by default; set RAG_QUANTIZATION=int8 to fall back to scalar
+# quantization if binary recall is too low for a corpus
+if os.environ.get("RAG_QUANTIZATION", "binary") == "int8":
+    _QUANTIZATION_CONFIG = ScalarQuantization(
+        scalar=ScalarQuantizationConfig(type=ScalarType.INT8, quantile=0.99, always_ram=True)
+    )
+    _OVERSAMPLING = 2.0
+else:
+    _QUANTIZATION_CONFIG = BinaryQuantization(binary=BinaryQuantizationConfig(always_ram=True))
+    _OVERSAMPLING = 3.0
+
+# Search the quantized vectors, then rescore the best candidates with the originals
+_QUANTIZED_SEARCH_PARAMS = SearchParams(
+    hnsw_ef=64,
+    quantization=QuantizationSearchParams(rescore=True, oversampling=_OVERSAMPLING)
+)
+
+# Corpora up to this many chunks are searched by brute force in NumPy instead of through a Qdrant index
+_BRUTE_FORCE_MAX_CHUNKS = int(os.environ.get("RAG_BRUTE_FORCE_MAX_CHUNKS", "10000"))
+
+class _QdrantRetriever:
+    """Server-side top-k search over a knowledge collection, returning only the payload fields _run needs."""
+    
+    def __init__(self, client: QdrantClient, embeddings: Embeddings, collection_name: str):
+        self.client = client
+        self.embed_query = embeddings.embed_query
+        self.embed_documents = embeddings.embed_documents
+        self.collection_name = collection_name
+    
+    def search(self, query: str, limit: int = 5, score_threshold: float = 0.3) -> List[Dict[str, Any]]:
+        """Return the payloads of the chunks most similar to the query."""
+        hits = self.client.query_points(
+            collection_name=self.collection_name,
+            query=self.embed_query(query),
+            limit=limit,
+            score_threshold=score_threshold,
+            search_params=_QUANTIZED_SEARCH_PARAMS,
+            with_payload=["page_content", "metadata"]
+        ).points
+        return [hit.payload for hit in hits]
+    
+    def search_batch(self, queries: List[str], limit: int = 5, score_threshold: float = 0.3) -> List[List[Dict[str, Any]]]:
+        """Return the payloads for each query, embedding all queries in one pass and searching in one request."""
+        responses = self.client.query_batch_points(
+            collection_name=self.collection_name,
+            requests=[
+                QueryRequest(
+                    query=query_vector,
+                    limit=limit,
+                    score_threshold=score_threshold,
+                    params=_QUANTIZED_SEARCH_PARAMS,
+                    with_payload=["page_content", "metadata"]
+                )
+                for query_vector in self.embed_documents(queries)
+            ]
+        )
+        return [[hit.payload for hit in response.points] for response in responses]
+
+def _quantize_int8(matrix: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Symmetric int8 quantization with one scale per row; returns (codes, scales)."""
+    scales = np.maximum(np.abs(matrix).max(axis=1), 1e-12) / 127
+    codes = np.round(matrix / scales[:, np.newaxis]).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+class _NumpyRetriever:
+    """Top-k cosine search over an in-process int8 matrix, for corpora too small to need an index."""
+    
+    def __init__(self, vectors: Iterable, payloads: List[Dict[str, Any]], embeddings: Embeddings):
+        matrix = np.array(vectors, dtype=np.float32)
+        matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+        
+        # Keep the matrix as int8 codes with one scale per row, a quarter of the float32 size
+        self.codes, self.scales = _quantize_int8(matrix)
+        self.payloads = payloads
+        self.embed_documents = embeddings.embed_documents
+    
+    def search(self, query: str, limit: int = 5, score_threshold: float = 0.3) -> List[Dict[str, Any]]:
+        """Return the payloads of the chunks most similar to the query."""
+        return self.search_batch([query], limit, score_threshold)[0]
+    
+    def search_batch(self, queries: List[str], limit: int = 5, score_threshold: float = 0.3) -> List[List[Dict[str, Any]]]:
+        """Return the payloads for each query, embedding all queries in one pass and scoring them together."""
+        query_matrix = np.array(self.embed_documents(queries), dtype=np.float32)
+        query_matrix /= np.maximum(np.linalg.norm(query_matrix, axis=1, keepdims=True), 1e-12)
+        query_codes, query_scales = _quantize_int8(query_matrix)
+        query_codes = query_codes.astype(np.float32).T
+        
+        # Score blocks of rows through float32 BLAS; int8 products summed over 384 dimensions stay
+        # below 2**24, so the integer dot products are exact and only one block is widened at a time
+        similarities = np.empty((len(self.codes), len(queries)), dtype=np.float32)
+        for start in range(0, len(self.codes), 4096):
+            block = self.codes[start:start + 4096].astype(np.float32)
+            similarities[start:start + 4096] = block @ query_codes
+        similarities *= np.outer(self.scales, query_scales)
+        
+        results = []
+        for column in similarities.T:
+            # Partial sort: select the top candidates, then order just those
+            top = np.argpartition(-column, limit)[:limit] if len(column) > limit else np.arange(len(column))
+            top = top[np.argsort(-column[top])]
+            results.append([self.payloads[i] for i in top if column[i] >= score_threshold])
+        return results
+
+def _map_bounded(executor: Executor, fn: Callable, items: Iterable, window: int) -> Iterator:
+    """Like executor.map, but keep at most window calls submitted ahead of the consumer."""
+    items = iter(items)
+    pending = deque(executor.submit(fn, item) for item in islice(items, window))
+    while pending:
+        result = pending.popleft().result()
+        for item in islice(items, 1):
+            pending.append(executor.submit(fn, item))
+        yield result
+
+def _batched(iterable: Iterable, size: int) -> Iterator[List]:
+    """Yield lists of up to size items from iterable."""
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
 
 class RAGQueryInput(BaseModel):
     """Input schema for RAG Query Tool."""
     query: str = Field(..., description="The question to search for in the knowledge base.")
 
+class RAGBatchQueryInput(BaseModel):
+    """Input schema for the batch RAG Query Tool."""
+    queries: List[str] = Field(..., description="The questions to search for in the knowledge base, one per entry.")
+
 class RAGTool(BaseTool):
     name: str = "Knowledge Base Query Tool"
     description: str = (
@@ -25,80 +213,122 @@ class RAGTool(BaseTool):
     def __init__(self, knowledge_dir: str = "knowledge", *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.knowledge_dir = knowledge_dir
+        
+        # Reuse a retriever built by another RAGTool over the same knowledge base
+        if knowledge_dir in _RETRIEVERS:
+            self.retriever = _RETRIEVERS[knowledge_dir]
+            return
         self._initialize_retriever()
+        if self.retriever:
+            _RETRIEVERS[knowledge_dir] = self.retriever
+    
+    def _load_and_split(self, file_path: str, text_splitter: TextSplitter, tokenizer: Tokenizer) -> List[Document]:
+        """Read one knowledge file and split it into chunks; returns no chunks if it cannot be read."""
+        try:
+            # Map the file and decode straight from the page cache; empty files cannot be mapped
+            with open(file_path, 'rb') as file:
+                if os.fstat(file.fileno()).st_size == 0:
+                    content = ""
+                else:
+                    with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                        content = mm[:].decode("utf-8", "ignore")
+        except Exception as e:
+            print(f"Error reading file {file_path}: {str(e)}")
+            return []
+        metadata = {"source": os.path.basename(file_path)}
+        return _split_document(text_splitter, tokenizer, content, metadata)
     
     def _initialize_retriever(self):
         """Initialize the vector store and retriever."""
         # Collect all text files from the knowledge directory
-        text_files = glob.glob(os.path.join(self.knowledge_dir, "*.txt"))
+        text_files = []
+        if os.path.isdir(self.knowledge_dir):
+            with os.scandir(self.knowledge_dir) as entries:
+                text_files = [entry.path for entry in entries if entry.is_file() and entry.name.endswith(".txt")]
         
         if not text_files:
             print(f"No text files found in {self.knowledge_dir}. Retriever not initialized.")
             return
         
-        # Load and process documents
-        documents = []
-        for file_path in text_files:
-            try:
-                with open(file_path, 'r', encoding='utf-8') as file:
-                    content = file.read()
-                    documents.append({
-                        "page_content": content,
-                        "metadata": {"source": os.path.basename(file_path)}
-                    })
-            except Exception as e:
-                print(f"Error reading file {file_path}: {str(e)}")
-        
-        if not documents:
-            print("No documents successfully loaded. Retriever not initialized.")
-            return
-        
-        # Split documents into chunks
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=200,
-            length_function=len,
-            add_start_index=True,
-            separators=["\n\n", "\n", ". ", " ", ""]
-        )
-        
-        splits = []
-        for doc in documents:
-            chunks = text_splitter.create_documents(
-                texts=[doc["page_content"]],
-                metadatas=[doc["metadata"]]
-            )
-            splits.extend(chunks)
-        
         # Initialize embeddings model
-        embeddings = HuggingFaceEmbeddings(
-            model_name="sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+        embeddings = _get_embeddings(_EMBEDDING_MODEL)
+        
+        tokenizer = Tokenizer.from_pretrained(_EMBEDDING_MODEL)
+        text_splitter = TextSplitter.from_huggingface_tokenizer(
+            tokenizer, capacity=_CHUNK_TOKENS, overlap=_CHUNK_OVERLAP_TOKENS
         )
         
         # Create vector store
         try:
-            vectordb = Qdrant.from_documents(
-                documents=splits,
-                embedding=embeddings,
-                location=":memory:",
-                collection_name="knowledge_store",
-                force_recreate=True
-            )
+            # Stream chunks from the files (read and split in parallel) through embedding in fixed-size
+            # batches. Small corpora are held in process for brute-force search; once a corpus outgrows
+            # that, the held vectors move to an in-memory Qdrant collection and later batches stream there
+            client = None
+            held_vectors, held_payloads = [], []
+            chunk_count = 0
+            workers = min(32, (os.cpu_count() or 1) * 4)
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                # Only a few files are read ahead of embedding, so their chunks do not pile up in memory
+                chunks = chain.from_iterable(_map_bounded(
+                    executor,
+                    lambda file_path: self._load_and_split(file_path, text_splitter, tokenizer),
+                    text_files,
+                    window=2 * workers
+                ))
+                for batch in _batched(chunks, 64):
+                    vectors = embeddings.embed_documents([chunk.page_content for chunk in batch])
+                    payloads = [{"page_content": chunk.page_content, "metadata": chunk.metadata} for chunk in batch]
+                    chunk_count += len(batch)
+                    
+                    if client is None and chunk_count <= _BRUTE_FORCE_MAX_CHUNKS:
+                        held_vectors.extend(vectors)
+                        held_payloads.extend(payloads)
+                        continue
+                    
+                    if client is None:
+                        # Size the collection from the first vectors and move the held chunks into it
+                        client = QdrantClient(location=":memory:")
+                        client.create_collection(
+                            collection_name="knowledge_store",
+                            vectors_config=VectorParams(size=len(vectors[0]), distance=Distance.COSINE),
+                            quantization_config=_QUANTIZATION_CONFIG
+                        )
+                        vectors = held_vectors + vectors
+                        payloads = held_payloads + payloads
+                        held_vectors, held_payloads = [], []
+                    
+                    client.upload_collection(
+                        collection_name="knowledge_store",
+                        vectors=vectors,
+                        payload=payloads,
+                        ids=list(range(chunk_count - len(vectors), chunk_count))
+                    )
+            
+            if not chunk_count:
+                print("No documents successfully loaded. Retriever not initialized.")
+                return
             
             # Initialize retriever
-            self.retriever = vectordb.as_retriever(
-                search_type="mmr",  # Maximal Marginal Relevance
-                search_kwargs={
-                    "k": 5,  # Number of documents to return
-                    "fetch_k": 10,  # More docs to consider initially
-                    "lambda_mult": 0.5,  # Balance relevance and diversity
-                    "score_threshold": 0.3  # Minimum similarity threshold
-                }
-            )
-            print(f"Retriever successfully initialized with {len(splits)} chunks from {len(text_files)} files.")
+            if client is None:
+                self.retriever = _NumpyRetriever(held_vectors, held_payloads, embeddings)
+            else:
+                self.retriever = _QdrantRetriever(client, embeddings, "knowledge_store")
+            print(f"Retriever successfully initialized with {chunk_count} chunks from {len(text_files)} files.")
         except Exception as e:
             print(f"Error initializing vector store: {str(e)}")
     
+    def _format_hits(self, hits: List[Dict[str, Any]]) -> str:
+        """Format retrieved payloads as source and content blocks."""
+        if not hits:
+            return "No relevant information found in the knowledge base."
+        
+        results = []
+        for payload in hits:
+            source = payload.get("metadata", {}).get("source", "Unknown")
+            results.append(f"Source: {source}\n\nContent:\n{payload.get('page_content', '')}\n")
+        
+        return "\n---\n".join(results)
+    
     def _run(self, query: str) -> str:
         """Run the RAG tool with the given query."""
         if not self.retriever:
@@ -106,18 +336,34 @@ class RAGTool(BaseTool):
         
         try:
             # Retrieve relevant documents
-            docs = self.retriever.get_relevant_documents(query)
-            
-            if not docs:
-                return "No relevant information found in the knowledge base."
-            
-            # Format results
-            results = []
-            for i, doc in enumerate(docs, 1):
-                source = doc.metadata.get("source", "Unknown")
-                results.append(f"Source: {source}\n\nContent:\n{doc.page_content}\n")
-            
-            return "\n---\n".join(results)
+            return self._format_hits(self.retriever.search(query))
         
         except Exception as e:
-            return f"Error querying the knowledge base: {str(e)}"
\ No newline at end of file
+            return f"Error querying the knowledge base: {str(e)}"
+    
+    def _run_batch(self, queries: List[str]) -> List[str]:
+        """Run the RAG tool for several queries, embedding and searching them together."""
+        if not self.retriever:
+            return ["Knowledge base is not initialized. Please check if text files exist in the knowledge directory."] * len(queries)
+        
+        try:
+            return [self._format_hits(hits) for hits in self.retriever.search_batch(queries)]
+        
+        except Exception as e:
+            return [f"Error querying the knowledge base: {str(e)}"] * len(queries)
+
+class BatchKnowledgeBaseQueryTool(BaseTool):
+    name: str = "Batch Knowledge Base Query Tool"
+    description: str = (
+        "Use this tool to look up several questions in the knowledge base at once. "
+        "Pass all the questions together; the results are returned in the same order."
+    )
+    args_schema: Type[BaseModel] = RAGBatchQueryInput
+    rag_tool: Any = None
+    
+    def _run(self, queries: List[str]) -> str:
+        """Run the shared RAG tool's batch query and label each result with its question."""
+        if not queries:
+            return "No queries given."
+        results = self.rag_tool._run_batch(queries)
+        return "\n===\n".join(f"Query: {query}\n\n{result}" for query, result in zip(queries, results))